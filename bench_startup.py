@@ -0,0 +1,130 @@
+"""Benchmark de inicialização (cold start) do agente.
+
+Cada medição roda em um processo Python novo, como acontece a cada `streamlit run`
+ou a cada worker criado:
+
+1. Importação de `csv_agent`, com o detalhamento de `python -X importtime`;
+2. Tempo até a página de upload ser renderizada (via `streamlit.testing`).
+
+Sai com código 1 se alguma mediana passar do orçamento ou se pandas/LangChain
+voltarem a ser importados no início.
+
+Uso:
+    python bench_startup.py [--runs 5] [--top 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Orçamentos de cold start (milissegundos, mediana das execuções)
+IMPORT_BUDGET_MS = 600
+RENDER_BUDGET_MS = 1000
+
+# Módulos que não podem ser carregados só para abrir a página de upload
+DEFERRED_MODULES = ['pandas', 'langchain', 'langchain_community', 'langchain_core']
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+RENDER_SCRIPT = """
+import time
+from streamlit.testing.v1 import AppTest
+
+at = AppTest.from_file('csv_agent.py', default_timeout=60)
+start = time.perf_counter()
+at.run()
+elapsed = (time.perf_counter() - start) * 1000
+if at.exception:
+    raise SystemExit(f'Erro ao renderizar: {at.exception}')
+print(elapsed)
+"""
+
+
+def run_importtime():
+    """Importa csv_agent com -X importtime e retorna as linhas da sua subárvore (self_us, cumulative_us, depth, nome)"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import csv_agent'],
+        cwd=APP_DIR, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise SystemExit(f"Falha ao importar csv_agent:\n{completed.stderr}")
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # cabeçalho
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(fields[0]), int(fields[1]), depth, name.strip()))
+
+    # O -X importtime lista os filhos antes do pai: a subárvore de csv_agent são as
+    # linhas aninhadas logo acima dela (o resto é a inicialização do interpretador)
+    end = next(i for i, row in enumerate(rows) if row[2] == 0 and row[3] == 'csv_agent')
+    start = end
+    while start > 0 and rows[start - 1][2] > 0:
+        start -= 1
+    return rows[start:end + 1]
+
+
+def measure_render():
+    """Tempo (ms) para executar o script do Streamlit até a página de upload"""
+    completed = subprocess.run(
+        [sys.executable, '-c', RENDER_SCRIPT],
+        cwd=APP_DIR, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise SystemExit(f"Falha ao renderizar a página:\n{completed.stderr}")
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="execuções por medição")
+    parser.add_argument('--top', type=int, default=15, help="quantos módulos mostrar no detalhamento")
+    args = parser.parse_args()
+
+    failures = []
+
+    # 1. Importação
+    import_times = []
+    for _ in range(args.runs):
+        rows = run_importtime()
+        import_times.append(rows[-1][1] / 1000)
+    import_ms = statistics.median(import_times)
+
+    print(f"Importação de csv_agent: {import_ms:.0f} ms (orçamento {IMPORT_BUDGET_MS} ms)")
+    print("\nMódulos mais caros importados diretamente por csv_agent (-X importtime, última execução):")
+    print(f"{'cumulativo (ms)':>16}  {'próprio (ms)':>12}  módulo")
+    top_level = [row for row in rows if row[2] == 1]
+    for self_us, cumulative_us, _, name in sorted(top_level, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:16.1f}  {self_us / 1000:12.1f}  {name}")
+
+    if import_ms > IMPORT_BUDGET_MS:
+        failures.append(f"importação levou {import_ms:.0f} ms (> {IMPORT_BUDGET_MS} ms)")
+
+    imported = {name for _, _, _, name in rows}
+    eager = [module for module in DEFERRED_MODULES if module in imported]
+    if eager:
+        failures.append(f"módulos que deveriam ser carregados sob demanda foram importados: {eager}")
+
+    # 2. Renderização da página de upload
+    render_ms = statistics.median(measure_render() for _ in range(args.runs))
+    print(f"\nRenderização da página de upload: {render_ms:.0f} ms (orçamento {RENDER_BUDGET_MS} ms)")
+    if render_ms > RENDER_BUDGET_MS:
+        failures.append(f"renderização levou {render_ms:.0f} ms (> {RENDER_BUDGET_MS} ms)")
+
+    if failures:
+        print("\n❌ Orçamento de inicialização estourado:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\n✅ Dentro do orçamento de inicialização")
+
+
+if __name__ == "__main__":
+    main()
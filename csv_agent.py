@@ -1,16 +1,30 @@
 import os
 import zipfile
-import pandas as pd
 import streamlit as st
 from pathlib import Path
-from langchain.llms import Ollama
 import tempfile
 import shutil
 import traceback
 import locale
 import re
-import ast
-import textwrap
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+
+# pandas e LangChain são importados sob demanda: nenhum dos dois é necessário para
+# renderizar a página de upload, e juntos dominam o tempo de inicialização
+# (veja bench_startup.py).
+
+
+# Modelo local usado pelo agente (Ollama)
+LLM_MODEL = "llama3.2:3b"
+
+
+# Limites do workspace de resultados intermediários (por sessão)
+WORKSPACE_MEMORY_BUDGET = 200 * 1024 * 1024   # bytes mantidos em RAM
+WORKSPACE_DISK_BUDGET = 1024 * 1024 * 1024    # bytes despejados em disco
+WORKSPACE_PROMPT_LIMIT = 10                   # quantas variáveis anunciar para a LLM
 
 
 def main():
@@ -19,19 +33,249 @@ def main():
         page_icon="📊",
         layout="wide"
     )
-    
+
+
+class SessionWorkspace:
+    """Guarda as variáveis intermediárias (ex.: `df_merged`, `top_5`) geradas pelo `exec` de perguntas anteriores.
+
+    As entradas mais recentes ficam em memória; quando o orçamento de RAM estoura, as menos usadas
+    são despejadas em disco (pickle) e, se o disco também estourar, são descartadas.
+    """
+
+    def __init__(self, memory_budget=WORKSPACE_MEMORY_BUDGET, disk_budget=WORKSPACE_DISK_BUDGET):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.in_memory = OrderedDict()   # nome -> objeto (ordem = menos usado primeiro)
+        self.on_disk = OrderedDict()     # nome -> caminho do pickle
+        self.entries = {}                # nome -> metadados (tamanho, descrição, pergunta de origem)
+        self.spill_dir = None
+        self.spill_cleanup = None
+        self.spill_count = 0
+
+    @staticmethod
+    def estimate_size(obj):
+        """Estima o uso de memória de um objeto em bytes"""
+        import pandas as pd
+        if isinstance(obj, pd.DataFrame):
+            return int(obj.memory_usage(deep=True).sum())
+        if isinstance(obj, pd.Series):
+            return int(obj.memory_usage(deep=True))
+        return sys.getsizeof(obj)
+
+    @staticmethod
+    def describe_object(obj):
+        """Resumo curto do objeto para ser anunciado no prompt"""
+        import pandas as pd
+        if isinstance(obj, pd.DataFrame):
+            columns = list(obj.columns)
+            if len(columns) > 15:
+                columns = columns[:15] + ['...']
+            return f"DataFrame {obj.shape[0]}x{obj.shape[1]}, colunas: {columns}"
+        if isinstance(obj, pd.Series):
+            return f"Series com {len(obj)} valores (nome: {obj.name!r}, índice: {obj.index.name!r})"
+        text = repr(obj) if isinstance(obj, str) else str(obj)
+        if len(text) > 80:
+            text = text[:77] + '...'
+        return f"{type(obj).__name__} = {text}"
+
+    @staticmethod
+    def layout_of(obj):
+        """Formato barato de calcular (tipo, dimensões, colunas) usado para notar alterações no lugar"""
+        import pandas as pd
+        if isinstance(obj, pd.DataFrame):
+            return ('DataFrame', obj.shape, tuple(obj.columns))
+        if isinstance(obj, pd.Series):
+            return ('Series', len(obj), obj.name, obj.index.name)
+        return (type(obj).__name__,)
+
+    @property
+    def memory_usage(self):
+        return sum(self.entries[name]['tamanho'] for name in self.in_memory)
+
+    @property
+    def disk_usage(self):
+        return sum(self.entries[name]['tamanho'] for name in self.on_disk)
+
+    def names(self):
+        return list(self.entries.keys())
+
+    def store(self, name, obj, question=None):
+        """Guarda (ou substitui) uma variável e aplica os limites de memória e disco"""
+        self.discard(name)
+        self.entries[name] = {
+            'tamanho': self.estimate_size(obj),
+            'descricao': self.describe_object(obj),
+            'pergunta': question,
+            'formato': self.layout_of(obj),
+        }
+        self.in_memory[name] = obj
+        self._enforce_budget()
+
+    def get(self, name):
+        """Retorna a variável, recarregando do disco se ela tiver sido despejada"""
+        objs = self.get_many([name])
+        if name not in objs:
+            raise KeyError(name)
+        return objs[name]
+
+    def get_many(self, names):
+        """Retorna várias variáveis de uma vez, recarregando do disco as que foram despejadas.
+
+        O orçamento só é reaplicado depois de carregar todas, e sem despejar as pedidas:
+        carregar uma não pode tirar do workspace outra que ainda vai ser lida.
+        """
+        import pandas as pd
+        objs = {}
+        for name in names:
+            if name in self.in_memory:
+                self.in_memory.move_to_end(name)
+            elif name in self.on_disk:
+                path = self.on_disk.pop(name)
+                try:
+                    self.in_memory[name] = pd.read_pickle(path)
+                except Exception:
+                    # Pickle corrompido ou apagado: a variável deixa de existir
+                    self.entries.pop(name, None)
+                    raise
+                finally:
+                    if os.path.exists(path):
+                        os.remove(path)
+            else:
+                continue
+            objs[name] = self.in_memory[name]
+        self._enforce_budget(pinned=set(objs))
+        return objs
+
+    def is_same(self, name, obj):
+        """Indica se `obj` é exatamente o objeto já guardado em memória com esse nome"""
+        return name in self.in_memory and self.in_memory[name] is obj
+
+    def refresh(self, name):
+        """Marca como recém-usada uma variável reutilizada pelo código.
+
+        Se ela foi alterada no lugar (ex.: ganhou uma coluna), tamanho e descrição são
+        recalculados; do contrário evita o `memory_usage(deep=True)`, caro em colunas de texto.
+        """
+        obj = self.in_memory[name]
+        meta = self.entries[name]
+        if self.layout_of(obj) != meta['formato']:
+            self.store(name, obj, meta['pergunta'])
+            return
+        self.in_memory.move_to_end(name)
+        self._enforce_budget()
+
+    def discard(self, name):
+        self.in_memory.pop(name, None)
+        path = self.on_disk.pop(name, None)
+        if path and os.path.exists(path):
+            os.remove(path)
+        self.entries.pop(name, None)
+
+    def clear(self):
+        """Esvazia o workspace (ex.: quando um novo arquivo é carregado)"""
+        self.in_memory.clear()
+        self.on_disk.clear()
+        self.entries.clear()
+        if self.spill_dir:
+            self.spill_cleanup()
+            self.spill_dir = None
+
+    def _enforce_budget(self, pinned=()):
+        # Despeja em disco as variáveis menos usadas até caber no orçamento de RAM.
+        # A mais recente e as `pinned` sempre ficam em memória, mesmo passando do limite.
+        while self.memory_usage > self.memory_budget:
+            candidates = [name for name in list(self.in_memory)[:-1] if name not in pinned]
+            if not candidates:
+                break
+            name = candidates[0]
+            self._spill(name, self.in_memory.pop(name))
+
+        # Se o disco também estourar, descarta as mais antigas de vez.
+        while self.on_disk and self.disk_usage > self.disk_budget:
+            name = next(iter(self.on_disk))
+            self.discard(name)
+
+    def _spill(self, name, obj):
+        import pandas as pd
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='csv_agent_workspace_')
+            # Remove os pickles quando a sessão acabar e o workspace for coletado
+            # (ou ao encerrar o processo), não só quando outro arquivo é carregado
+            self.spill_cleanup = weakref.finalize(self, shutil.rmtree, self.spill_dir, ignore_errors=True)
+        self.spill_count += 1
+        path = os.path.join(self.spill_dir, f"{self.spill_count}_{name}.pkl")
+        try:
+            pd.to_pickle(obj, path)
+            self.on_disk[name] = path
+        except Exception:
+            # Objetos que não podem ser serializados são simplesmente descartados
+            self.entries.pop(name, None)
+
+    def prompt_section(self, limit=WORKSPACE_PROMPT_LIMIT):
+        """Texto que anuncia para a LLM as variáveis disponíveis de perguntas anteriores"""
+        if not self.entries:
+            return ""
+
+        # As mais recentes primeiro
+        recent = list(self.on_disk.keys()) + list(self.in_memory.keys())
+        recent = list(reversed(recent))[:limit]
+
+        lines = []
+        for name in recent:
+            meta = self.entries[name]
+            line = f"- `{name}`: {meta['descricao']}"
+            if meta['pergunta']:
+                line += f' (criado na pergunta: "{meta["pergunta"]}")'
+            lines.append(line)
+
+        return (
+            "RESULTADOS DE PERGUNTAS ANTERIORES (variáveis que JÁ EXISTEM e podem ser usadas diretamente):\n"
+            + "\n".join(lines)
+            + "\nSe a pergunta for uma continuação (ex.: \"e o segundo?\"), reutilize essas variáveis em vez de recalcular merges e agrupamentos.\n"
+        )
+
 
 class CSVAnalysisAgent:
     def __init__(self):
-        """Inicializa o agente com LLM local gratuita (Ollama)"""
-        try:
-            # Usando Ollama com modelo gratuito
-            self.llm = Ollama(model="llama3.2:3b", temperature=0)
-            self.dataframes = {}
-            self.current_df = None
-        except Exception as e:
-            st.error(f"Erro ao inicializar LLM: {e}")
-            st.info("Certifique-se de ter o Ollama instalado e rodando")
+        """Inicializa o agente; a LLM local gratuita (Ollama) só é criada na primeira consulta"""
+        self._llm = None
+        self._llm_lock = threading.Lock()
+        self.llm_ready = False
+        self.llm_error = None
+        self.warmup_thread = None
+        self.dataframes = {}
+        self.current_df = None
+        # Variáveis intermediárias das perguntas anteriores desta sessão
+        self.workspace = SessionWorkspace()
+
+    @property
+    def llm(self):
+        """Cliente Ollama, criado (e o LangChain importado) apenas no primeiro uso"""
+        if self._llm is None:
+            with self._llm_lock:
+                if self._llm is None:
+                    from langchain.llms import Ollama
+                    # Usando Ollama com modelo gratuito
+                    self._llm = Ollama(model=LLM_MODEL, temperature=0)
+        return self._llm
+
+    def warm_up_llm(self):
+        """Health check em segundo plano: cria o cliente e já carrega o modelo no Ollama"""
+        # Só roda de novo se a verificação anterior terminou com erro
+        # (ex.: o Ollama foi iniciado depois do app)
+        if self.warmup_thread is not None and (self.warmup_thread.is_alive() or not self.llm_error):
+            return
+
+        def health_check():
+            try:
+                self.llm.invoke("Responda apenas: ok")
+                self.llm_ready = True
+                self.llm_error = None
+            except Exception as e:
+                self.llm_error = str(e)
+
+        self.warmup_thread = threading.Thread(target=health_check, daemon=True)
+        self.warmup_thread.start()
     
     def extract_zip_files(self, zip_path, extract_to):
         """Descompacta arquivos zip"""
@@ -45,6 +289,7 @@ class CSVAnalysisAgent:
     
     def load_csv_files(self, directory):
         """Carrega todos os arquivos CSV de um diretório"""
+        import pandas as pd
         csv_files = {}
         
         for file_path in Path(directory).rglob("*.csv"):
@@ -143,11 +388,12 @@ INFORMAÇÕES DO DATASET:
 - Nome do DataFrame: df
 - Colunas disponíveis: {list(self.current_df.columns)}
 """
+            workspace_info = self.workspace.prompt_section()
             prompt = f"""
 Você é um especialista em Python/Pandas que gera pequenos trechos de código para responder a uma pergunta.
 
 {dataset_info}
-
+{workspace_info}
 REGRAS CRÍTICAS E OBRIGATÓRIAS:
 1.  O DataFrame `df` já existe. Opere diretamente nele.
 2.  O resultado final DEVE ser armazenado em uma variável string chamada `resultado`.
@@ -190,6 +436,12 @@ CÓDIGO GERADO:
 contagem_notas = len(df)
 resultado = f"Foram emitidas {{contagem_notas}} notas fiscais."
 
+# GABARITO 6: Pergunta de CONTINUAÇÃO (reaproveitando uma variável de pergunta anterior)
+PERGUNTA: "E o segundo mais caro?" (com `ranking` já existente nos RESULTADOS DE PERGUNTAS ANTERIORES)
+CÓDIGO GERADO:
+linha = ranking.iloc[1]
+resultado = f"O segundo colocado é '{{linha.iloc[0]}}' com valor de R$ {{linha.iloc[1]:.2f}}."
+
 ---
 PERGUNTA REAL DO USUÁRIO: "{question}"
 
@@ -209,13 +461,16 @@ INFORMAÇÕES DOS DATASETS:
 Coluna em comum para junção (merge): 'CHAVE DE ACESSO'
 """
             safety_rules = "REGRAS: Gere APENAS código Python. NÃO use `print`. Salve a resposta na variável `resultado`."
+            workspace_info = self.workspace.prompt_section()
             
             prompt = f"""
             {dataset_info}
+            {workspace_info}
             {safety_rules}
             PERGUNTA DO USUÁRIO: "{question}"
 
             INSTRUÇÃO OBRIGATÓRIA: Primeiro, junte os dataframes com `df_merged = pd.merge(df_cabecalho, df_itens, on='CHAVE DE ACESSO')`. Depois, analise o `df_merged`.
+            Se `df_merged` já aparecer nos RESULTADOS DE PERGUNTAS ANTERIORES, use-o diretamente sem refazer o merge.
 
             EXEMPLO DE CÓDIGO:
             df_merged = pd.merge(df_cabecalho, df_itens, on='CHAVE DE ACESSO')
@@ -229,6 +484,8 @@ Coluna em comum para junção (merge): 'CHAVE DE ACESSO'
 
         try:
             response = self.llm.invoke(prompt)
+            self.llm_ready = True
+            self.llm_error = None
             # Lógica de limpeza robusta
             cleaned_code = response.strip()
             if cleaned_code.startswith('```python'):
@@ -240,8 +497,9 @@ Coluna em comum para junção (merge): 'CHAVE DE ACESSO'
             return cleaned_code
         except Exception as e:
             return f"Erro na interpretação: {str(e)}"
-    def step2_execute_code(self, generated_code, selected_files):
+    def step2_execute_code(self, generated_code, selected_files, question=None):
         """ETAPA 2: Executa o código Python gerado pela LLM com validação."""
+        import pandas as pd
         
         # Cria um namespace seguro
         namespace = {
@@ -257,9 +515,20 @@ Coluna em comum para junção (merge): 'CHAVE DE ACESSO'
             namespace['df_cabecalho'] = self.dataframes['202401_NFs_Cabecalho.csv']
             namespace['df_itens'] = self.dataframes['202401_NFs_Itens.csv']
 
+        # Injeta apenas as variáveis de perguntas anteriores que o código realmente usa,
+        # evitando recarregar do disco o que foi despejado e não é necessário
+        reserved_names = set(namespace)
+
         try:
+            needed = [
+                name for name in self.workspace.names()
+                if name not in reserved_names and re.search(rf'\b{re.escape(name)}\b', generated_code)
+            ]
+            namespace.update(self.workspace.get_many(needed))
+
             exec(generated_code, namespace)
             resultado = namespace.get('resultado', 'Código executado mas variável resultado não encontrada')
+            self.update_workspace(namespace, reserved_names, question)
             
             return {
                 'sucesso': True,
@@ -274,6 +543,26 @@ Coluna em comum para junção (merge): 'CHAVE DE ACESSO'
                 'traceback': traceback.format_exc(),
                 'codigo_executado': generated_code
             }    
+
+    def update_workspace(self, namespace, reserved_names, question=None):
+        """Guarda no workspace os DataFrames e Series nomeados criados pelo código executado"""
+        import pandas as pd
+        loaded = [id(df) for df in self.dataframes.values()]
+
+        for name, value in namespace.items():
+            if name.startswith('_') or name in reserved_names:
+                continue
+            # Escalares e strings costumam ser contadores de laço ou temporários
+            # (`i`, `valor`) e só ocupariam espaço no prompt
+            if not isinstance(value, (pd.DataFrame, pd.Series)):
+                continue
+            if id(value) in loaded:
+                # Apenas um apelido para um dos CSVs carregados, não há o que guardar
+                continue
+            if self.workspace.is_same(name, value):
+                self.workspace.refresh(name)
+                continue
+            self.workspace.store(name, value, question)
         
 
     def step3_generate_response(self, user_question, execution_result):
@@ -354,6 +643,8 @@ Coluna em comum para junção (merge): 'CHAVE DE ACESSO'
         
         try:
             response = self.llm.invoke(prompt)
+            self.llm_ready = True
+            self.llm_error = None
             return response
         except Exception as e:
             return f"Erro ao gerar resposta: {str(e)}"
@@ -385,7 +676,7 @@ Coluna em comum para junção (merge): 'CHAVE DE ACESSO'
             st.code(generated_code, language='python')
             
             st.write("**ETAPA 2: Executando código...**")
-            execution_result = self.step2_execute_code(generated_code, arquivos_escolhidos)
+            execution_result = self.step2_execute_code(generated_code, arquivos_escolhidos, question)
             
             if execution_result['sucesso']:
                 st.success("✅ Código executado com sucesso!")
@@ -450,6 +741,17 @@ Coluna em comum para junção (merge): 'CHAVE DE ACESSO'
         return None
 
 
+def show_llm_status(agent):
+    """Mostra no sidebar o resultado do health check da LLM"""
+    if agent.llm_error:
+        st.error(f"Erro ao inicializar LLM: {agent.llm_error}")
+        st.info("Certifique-se de ter o Ollama instalado e rodando")
+    elif agent.llm_ready:
+        st.caption(f"🟢 Modelo `{LLM_MODEL}` pronto")
+    else:
+        st.caption(f"⏳ Modelo `{LLM_MODEL}` carregando...")
+
+
 def main():   
     if 'history' not in st.session_state:
         st.session_state.history = []
@@ -462,6 +764,8 @@ def main():
         st.session_state.agent = CSVAnalysisAgent()
     
     agent = st.session_state.agent
+    # Carrega o modelo enquanto o usuário ainda está escolhendo o arquivo
+    agent.warm_up_llm()
     
     # Sidebar para upload e configuração
     with st.sidebar:
@@ -498,9 +802,20 @@ def main():
                     agent.dataframes = agent.load_csv_files(temp_dir)
                 
                 st.success(f"Carregados {len(agent.dataframes)} arquivo(s) CSV")
+
+                # Resultados intermediários só valem para os dados de onde vieram
+                upload_id = (uploaded_file.name, uploaded_file.size)
+                if st.session_state.get('upload_id') != upload_id:
+                    agent.workspace.clear()
+                    st.session_state.upload_id = upload_id
                 
             except Exception as e:
                 st.error(f"Erro ao processar arquivo: {e}")
+
+        # O health check roda em segundo plano e não dispara um rerun ao terminar:
+        # enquanto ele não acaba, só o trecho de status é reexecutado a cada 2 s
+        llm_pending = not (agent.llm_ready or agent.llm_error)
+        st.fragment(show_llm_status, run_every=2 if llm_pending else None)(agent)
     
     # Interface principal
     if agent.dataframes:
@@ -624,6 +939,17 @@ def main():
                         st.markdown(item['resposta'])
             else:
                 st.info("O histórico de suas análises aparecerá aqui.")    
+
+            if agent.workspace.names():
+                with st.expander("🧠 Resultados intermediários guardados nesta sessão"):
+                    st.write(
+                        f"Memória: {agent.workspace.memory_usage / 1024**2:.1f} MB | "
+                        f"Disco: {agent.workspace.disk_usage / 1024**2:.1f} MB"
+                    )
+                    for name in agent.workspace.names():
+                        meta = agent.workspace.entries[name]
+                        local = "disco" if name in agent.workspace.on_disk else "memória"
+                        st.write(f"`{name}` ({local}): {meta['descricao']}")
     else:
         st.info("👆 Faça upload de um arquivo CSV ou ZIP contendo CSVs para começar")
         